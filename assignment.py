@@ -0,0 +1,192 @@
+import heapq
+import itertools
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from datastore import Property, StaleWriteError, on_reload
+
+MAX_WRITE_ATTEMPTS = 3  # Attempts before giving up when other processes keep changing the assignments
+
+
+class AssignmentEngine(object):
+    assignments: Property
+    available_staff: Property
+    counts: Dict[str, int]
+
+    def __init__(self, assignments: Property, available_staff: Property):
+        """
+        Assigns tickets to the available staff member with the fewest open tickets.
+        Entries in the heap are invalidated lazily: an entry is only used if the staff member is still available and
+        the entry's count matches their current count, so every operation is O(log n) amortized.
+        :param assignments: Property mapping ticket IDs to the ID of the assigned staff member.
+        :param available_staff: Property holding the IDs of staff members that are accepting tickets.
+        """
+        self.assignments = assignments
+        self.available_staff = available_staff
+        self._expected: Dict[str, Any] = {}
+        self._reloaded = False
+        self.reload()
+
+        assignments.subscribe(lambda value: self._on_change(assignments.key, value))
+        available_staff.subscribe(lambda value: self._on_change(available_staff.key, value))
+
+    def _on_change(self, key: str, value):
+        # Our own writes keep the heap up to date, anything else means the stored data changed under us
+        if key in self._expected and self._expected[key] == value:
+            return
+        self.reload()
+
+    def _set(self, prop: Property, value):
+        """
+        :raises StaleWriteError: If another process changed the property first. The engine has already been
+        reloaded from the store when this is raised.
+        """
+        self._expected[prop.key] = value
+        self._reloaded = False
+        try:
+            prop.set(value)
+        finally:
+            del self._expected[prop.key]
+
+        if self._reloaded:
+            # Another key changed while we were writing, so the reload didn't include our own write
+            self.reload()
+
+    def _retry(self, operation: Callable[[], Any]):
+        for _ in range(MAX_WRITE_ATTEMPTS - 1):
+            try:
+                return operation()
+            except StaleWriteError:
+                self.reload()
+        return operation()
+
+    def reload(self):
+        """
+        Rebuilds the counts and the heap from the stored assignments and availability.
+        """
+        self._reloaded = True
+        self.counts = {}
+        self._available = set(self.available_staff.get())
+        self._heap: List[Tuple[int, int, str]] = []
+        self._sequence = itertools.count()
+
+        for staff_id in self.assignments.get().values():
+            self.counts[staff_id] = self.counts.get(staff_id, 0) + 1
+
+        for staff_id in self._available:
+            self._push(staff_id)
+
+    def _push(self, staff_id: str):
+        heapq.heappush(self._heap, (self.counts.get(staff_id, 0), next(self._sequence), staff_id))
+
+        # Drop stale entries once they outnumber the live ones
+        if len(self._heap) > 2 * len(self._available) + 16:
+            self._heap = [
+                (self.counts.get(staff_id, 0), next(self._sequence), staff_id) for staff_id in self._available
+            ]
+            heapq.heapify(self._heap)
+
+    def _is_current(self, entry: Tuple[int, int, str]) -> bool:
+        count, _, staff_id = entry
+        return staff_id in self._available and self.counts.get(staff_id, 0) == count
+
+    def _save(self):
+        self._set(self.available_staff, sorted(self._available))
+
+    def is_available(self, staff_id: str) -> bool:
+        return staff_id in self._available
+
+    def _set_available(self, staff_id: str, available: bool):
+        if available and staff_id not in self._available:
+            self._available.add(staff_id)
+            self._push(staff_id)
+            self._save()
+        elif not available and staff_id in self._available:
+            self._available.discard(staff_id)
+            self._save()
+
+    def set_available(self, staff_id: str, available: bool):
+        """
+        :raises StaleWriteError: If other processes kept changing the availability.
+        """
+        self._retry(lambda: self._set_available(staff_id, available))
+
+    def assign(self, ticket_id: str, is_eligible: Callable[[str], bool] = lambda staff_id: True) -> Optional[str]:
+        """
+        Assigns a ticket to the least loaded available staff member, replacing any existing assignment.
+        :param ticket_id: ID of the ticket.
+        :param is_eligible: Called with a staff ID, staff that are not eligible are skipped for this ticket.
+        :return: The ID of the assigned staff member, or None if nobody is available.
+        :raises StaleWriteError: If other processes kept changing the assignments.
+        """
+        return self._retry(lambda: self._assign(ticket_id, is_eligible))
+
+    def _assign(self, ticket_id: str, is_eligible: Callable[[str], bool]) -> Optional[str]:
+        assignments = dict(self.assignments.get())
+        # A ticket that is assigned again no longer counts towards the staff member it was assigned to before
+        previous_staff_id = assignments.pop(ticket_id, None)
+        if previous_staff_id is not None:
+            self._lower_count(previous_staff_id)
+
+        skipped = []
+        try:
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                if not self._is_current(entry):
+                    continue
+
+                staff_id = entry[2]
+                if not is_eligible(staff_id):
+                    # They may only be missing from the member cache, so their stored availability is left alone
+                    print(f"Skipping staff member {staff_id} for ticket {ticket_id} because they are not eligible.")
+                    skipped.append(entry)
+                    continue
+
+                self.counts[staff_id] = self.counts.get(staff_id, 0) + 1
+                self._push(staff_id)
+
+                assignments[ticket_id] = staff_id
+                self._set(self.assignments, assignments)
+
+                return staff_id
+
+            if previous_staff_id is not None:
+                self._set(self.assignments, assignments)
+
+            return None
+        finally:
+            for entry in skipped:
+                heapq.heappush(self._heap, entry)
+
+    def release(self, ticket_id: str) -> Optional[str]:
+        """
+        Removes a ticket's assignment and lowers the load of the staff member it was assigned to.
+        :return: The ID of the staff member the ticket was assigned to, if any.
+        :raises StaleWriteError: If other processes kept changing the assignments.
+        """
+        return self._retry(lambda: self._release(ticket_id))
+
+    def _release(self, ticket_id: str) -> Optional[str]:
+        assignments = dict(self.assignments.get())
+        staff_id = assignments.pop(ticket_id, None)
+        if staff_id is None:
+            return None
+
+        self._lower_count(staff_id)
+        self._set(self.assignments, assignments)
+
+        return staff_id
+
+    def _lower_count(self, staff_id: str):
+        self.counts[staff_id] -= 1
+        if self.counts[staff_id] <= 0:
+            del self.counts[staff_id]
+
+        if staff_id in self._available:
+            self._push(staff_id)
+
+
+engine = AssignmentEngine(
+    Property("ticket_assignments", {}),
+    Property("available_staff", [])
+)
+on_reload(engine.reload)
@@ -1,8 +1,44 @@
 from discord import Message
+
+import settings
 from .commands import commands
-from .util import CommandEntry
+from .suggestions import SuggestionIndex
+from .util import CommandEntry, NOT_ALLOWED_EMBED, check_roles, create_embed
+
+suggestion_index = SuggestionIndex(commands)
+
+
+async def suggest_commands(message: Message):
+    prefix = settings.prefix.get()
+    if not message.content.startswith(prefix):
+        return
+
+    suggestions, corrected = suggestion_index.lookup(message.content[len(prefix):])
+    if not suggestions:
+        return
+
+    allowed = [command for command in suggestions if check_roles(message.author, command.role_groups)]
+
+    if not allowed:
+        if not corrected:
+            await message.channel.send(
+                embed=NOT_ALLOWED_EMBED
+            )
+        return
+
+    await message.channel.send(
+        embed=create_embed(
+            "Did You Mean" if corrected else "Command Help",
+            "\n".join(command.get_help_line() for command in allowed)
+        )
+    )
 
 
 async def handle_message(message: Message):
+    matched = False
     for command in commands:
-        await command.handle_message(message)
+        if await command.handle_message(message):
+            matched = True
+
+    if not matched:
+        await suggest_commands(message)
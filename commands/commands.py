@@ -1,5 +1,7 @@
+import settings
 import shared
-from .handlers import tickets, buyers
+from profiler import profiler
+from .handlers import tickets, buyers, profiling, history
 from .util import CommandEntry as Entry, create_help_embed
 from . import handlers
 from .role_groups import *
@@ -17,23 +19,27 @@ commands = [
         r'new ((?:.|\n){10,})',
         tickets.new_ticket,
         role_groups=EVERYONE,
-        help_triggers=("new",),
         command_help_syntax="new <reason>",
         command_help_text="Creates a new ticket with the specified reason. "
-                          "The reason must be at least 10 characters long."
+                          "The reason must be at least 10 characters long.",
+        max_concurrency=5,
+        max_queue=20,
+        timeout=30
     ),
     Entry(
         r'close(?: (.+))?',
         tickets.close_ticket,
         role_groups=EVERYONE,
         command_help_syntax="close [message]",
-        command_help_text="Closes the current ticket with an optional message."
+        command_help_text="Closes the current ticket with an optional message.",
+        max_concurrency=5,
+        max_queue=20,
+        timeout=30
     ),
     Entry(
         r'getopen',
         tickets.get_accepting_tickets,
         role_groups=EVERYONE,
-        help_triggers=("getopen",),
         command_help_syntax="getopen",
         command_help_text="Returns whether we are currently accepting new tickets."
     ),
@@ -51,25 +57,65 @@ commands = [
         r'setopen ((?:true)|(?:false))',
         tickets.set_accepting_tickets,
         role_groups=ALL_STAFF,
-        help_triggers=("setopen",),
         command_help_syntax="setopen <true|false>",
         command_help_text="Sets whether new tickets will be accepted."
     ),
+    Entry(
+        r'available ((?:true)|(?:false))',
+        tickets.set_available,
+        role_groups=TICKET_STAFF,
+        command_help_syntax="available <true|false>",
+        command_help_text="Sets whether you will be assigned new tickets. "
+                          "New tickets go to the available staff member with the fewest open tickets."
+    ),
+    Entry(
+        r'getavailable',
+        tickets.get_available,
+        role_groups=TICKET_STAFF,
+        command_help_syntax="getavailable",
+        command_help_text="Returns whether you are available for new tickets and how many you have open."
+    ),
     Entry(
         r'newfor (@mention)(?: ((?:.|\n)+))?',
         tickets.newfor_ticket,
         role_groups=ALL_STAFF,
-        help_triggers=('newfor',),
         command_help_syntax="newfor <user> [reason]",
-        command_help_text="Creates a new ticket for the provided user. Use full name with discriminator or @mention."
+        command_help_text="Creates a new ticket for the provided user. Use full name with discriminator or @mention.",
+        max_concurrency=5,
+        max_queue=20,
+        timeout=30
     ),
     Entry(
         r'buyer (@mention)(?: ((?:true)|(?:false)))?',
         buyers.set_buyer_role,
         role_groups=ALL_STAFF,
-        help_triggers=('buyer',),
         command_help_syntax="buyer <user> [true|false]",
-        command_help_text="Sets whether the provided user has the Buyer role. Defaults to true."
+        command_help_text="Sets whether the provided user has the Buyer role. Defaults to true.",
+        max_concurrency=3,
+        max_queue=10,
+        timeout=15
+    ),
+    Entry(
+        r'tickets author ((?:[^#@:]+#\d{4})|(?:<@!?\d{8,32}>)|(?:\d{8,32}))(?: page (\d+))?',
+        history.tickets_by_author,
+        role_groups=ALL_STAFF,
+        command_help_syntax="tickets author <user> [page <number>]",
+        command_help_text="Lists closed tickets opened by the provided user. Use a mention, user ID or full name "
+                          "with discriminator."
+    ),
+    Entry(
+        r'tickets search (.+?)(?: page (\d+))?',
+        history.tickets_by_keyword,
+        role_groups=ALL_STAFF,
+        command_help_syntax="tickets search <words> [page <number>]",
+        command_help_text="Lists closed tickets whose reason or close message contains all of the provided words."
+    ),
+    Entry(
+        r'tickets date (\d{4}-\d{2}-\d{2}) (\d{4}-\d{2}-\d{2})(?: page (\d+))?',
+        history.tickets_by_date,
+        role_groups=ALL_STAFF,
+        command_help_syntax="tickets date <YYYY-MM-DD> <YYYY-MM-DD> [page <number>]",
+        command_help_text="Lists tickets closed between the two dates, inclusive."
     ),
 
     # Commands for admin
@@ -77,10 +123,30 @@ commands = [
         r'prefix (.+)',
         handlers.change_prefix,
         role_groups=ADMIN,
-        help_triggers=('prefix',),
         command_help_syntax="prefix <value>",
         command_help_text="Updates the prefix for all subsequent commands."
+    ),
+    Entry(
+        r'profile (\d+)(?: (\d+))?',
+        profiling.run_profiler,
+        role_groups=ADMIN,
+        command_help_syntax="profile <seconds> [top]",
+        command_help_text="Samples the bot for the given number of seconds and posts the busiest "
+                          "handlers and functions (up to 25) along with a collapsed-stack file for flamegraphs.",
+        max_concurrency=1,
+        timeout=None,
+        shed_message="The profiler is already running."
     )
 ]
 
 shared.help_embed = create_help_embed(commands)
+
+
+def _rebuild_help_embed(value):
+    # The help embed shows every command with the prefix, in the embed color
+    shared.help_embed = create_help_embed(commands)
+
+
+settings.prefix.subscribe(_rebuild_help_embed)
+settings.embed_color.subscribe(_rebuild_help_embed)
+profiler.register_handlers(commands)
@@ -2,7 +2,8 @@ from discord import Message
 
 import shared
 import settings
-from commands.util import COMMAND_SUCCESS_EMBED, create_embed
+from commands.util import COMMAND_SUCCESS_EMBED, create_embed, STALE_WRITE_EMBED
+from datastore import StaleWriteError
 
 
 async def print_help(*, message: Message):
@@ -10,7 +11,12 @@ async def print_help(*, message: Message):
 
 
 async def change_prefix(new_prefix: str, *, message: Message):
-    settings.prefix.set(new_prefix)
+    try:
+        settings.prefix.set(new_prefix)
+    except StaleWriteError:
+        await message.channel.send(embed=STALE_WRITE_EMBED)
+        return
+
     await message.channel.send(embed=COMMAND_SUCCESS_EMBED)
 
 
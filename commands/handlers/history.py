@@ -0,0 +1,83 @@
+import datetime
+import re
+from typing import Any, Dict, List
+
+from discord import Message
+
+from commands.util import create_embed, create_error_embed, get_member, MEMBER_NOT_FOUND_EMBED
+from history import history
+
+PAGE_SIZE = 10
+MAX_REASON_DISPLAY_LENGTH = 100
+
+
+def _shorten(text: str) -> str:
+    if text and len(text) > MAX_REASON_DISPLAY_LENGTH:
+        return text[:MAX_REASON_DISPLAY_LENGTH - 3] + "..."
+    return text
+
+
+def _create_results_embed(title: str, total: int, records: List[Dict[str, Any]], page: int, exact: bool = True):
+    page_count = max((total + PAGE_SIZE - 1) // PAGE_SIZE, 1)
+    approximately = "" if exact else "~"
+
+    if not records:
+        return create_embed(title, f"No tickets found. (Page {page + 1}/{approximately}{page_count})")
+
+    lines = []
+    for record in records:
+        close_dt = datetime.datetime.fromtimestamp(record["close_time"])
+        lines.append(
+            f"**#{record['id']}** {close_dt:%Y-%m-%d %H:%M} - {record['author_name']}\n"
+            f"Reason: {_shorten(record['reason'])}\n"
+            f"Close message: {_shorten(record['close_message'])}"
+        )
+
+    return create_embed(
+        title,
+        "\n\n".join(lines) + f"\n\nPage {page + 1}/{approximately}{page_count} ({approximately}{total} ticket(s))"
+    )
+
+
+def _parse_page(page: str) -> int:
+    return max(int(page) - 1, 0) if page else 0
+
+
+async def tickets_by_author(name_or_mention: str, page: str = None, *, message: Message):
+    match = re.fullmatch(r'<@!?(\d{8,32})>|(\d{8,32})', name_or_mention)
+    if match:
+        author_id = match.group(1) or match.group(2)
+    else:
+        member = get_member(name_or_mention)
+        if member is None:
+            await message.channel.send(embed=MEMBER_NOT_FOUND_EMBED)
+            return
+        author_id = str(member.id)
+
+    page = _parse_page(page)
+    total, records = history.by_author_id(author_id, page, PAGE_SIZE)
+    await message.channel.send(embed=_create_results_embed("Ticket History", total, records, page))
+
+
+async def tickets_by_keyword(text: str, page: str = None, *, message: Message):
+    page = _parse_page(page)
+    total, exact, records = history.search(text, page, PAGE_SIZE)
+    await message.channel.send(embed=_create_results_embed("Ticket Search", total, records, page, exact))
+
+
+async def tickets_by_date(start: str, end: str, page: str = None, *, message: Message):
+    try:
+        start_dt = datetime.datetime.strptime(start, "%Y-%m-%d")
+        # The end date is inclusive
+        end_dt = datetime.datetime.strptime(end, "%Y-%m-%d") + datetime.timedelta(days=1)
+    except ValueError:
+        await message.channel.send(embed=create_error_embed("Dates must be in the format YYYY-MM-DD."))
+        return
+
+    if start_dt >= end_dt:
+        await message.channel.send(embed=create_error_embed("The start date must not be after the end date."))
+        return
+
+    page = _parse_page(page)
+    total, records = history.by_date(int(start_dt.timestamp()), int(end_dt.timestamp()), page, PAGE_SIZE)
+    await message.channel.send(embed=_create_results_embed("Ticket History", total, records, page))
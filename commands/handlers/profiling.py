@@ -0,0 +1,68 @@
+import asyncio
+import io
+
+import discord
+from discord import Message
+
+from commands.util import create_error_embed, create_embed
+from profiler import profiler
+
+MAX_PROFILE_SECONDS = 300
+DEFAULT_TOP_N = 10
+MAX_TOP_N = 25  # Keeps the summary inside Discord's embed description limit
+MAX_NAME_LENGTH = 60
+
+
+def _shorten(name: str) -> str:
+    if len(name) > MAX_NAME_LENGTH:
+        return "..." + name[-(MAX_NAME_LENGTH - 3):]
+    return name
+
+
+def _format_counts(counts, total: int) -> str:
+    if not counts:
+        return "No samples."
+    return "\n".join(
+        f"`{count / total:6.1%}` {_shorten(name)}" for name, count in counts
+    )
+
+
+async def run_profiler(seconds: str, top_n: str = None, *, message: Message):
+    seconds = int(seconds)
+    top_n = min(int(top_n), MAX_TOP_N) if top_n else DEFAULT_TOP_N
+
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        await message.channel.send(
+            embed=create_error_embed(f"The duration must be between 1 and {MAX_PROFILE_SECONDS} seconds.")
+        )
+        return
+
+    if profiler.running:
+        await message.channel.send(embed=create_error_embed("The profiler is already running."))
+        return
+
+    await message.channel.send(
+        embed=create_embed("Profiler Started", f"Sampling the bot for {seconds} second(s).")
+    )
+
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+
+    total = profiler.total_samples or 1
+
+    summary_embed = create_embed(
+        "Profiler Results",
+        f"Samples: {profiler.total_samples}\n\n"
+        f"__**Top handlers**__\n{_format_counts(profiler.top_handlers(top_n), total)}\n\n"
+        f"__**Top functions**__\n{_format_counts(profiler.top_functions(top_n), total)}"
+    )
+
+    stacks_file = discord.File(
+        io.BytesIO(profiler.collapsed_stacks().encode("utf-8")),
+        filename="profile.collapsed"
+    )
+
+    await message.channel.send(embed=summary_embed, file=stacks_file)
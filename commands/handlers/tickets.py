@@ -8,9 +8,12 @@ from discord import Message, Role, TextChannel, Member
 
 import settings
 import shared
+from assignment import engine as assignment_engine
 from commands import role_groups
-from commands.util import create_error_embed, COMMAND_SUCCESS_EMBED, create_embed, get_member, MEMBER_NOT_FOUND_EMBED
-from datastore import Property, root
+from commands.util import create_error_embed, COMMAND_SUCCESS_EMBED, create_embed, get_member, MEMBER_NOT_FOUND_EMBED, \
+    STALE_WRITE_EMBED
+from datastore import Property, StaleWriteError, root
+from history import history
 
 CUSTOMER_SUPPORT_ROLE_GROUP = role_groups.SUPPORT
 TICKET_CATEGORY_ID = 1234567890  # Place ID of the ticket category here
@@ -69,6 +72,15 @@ def setup():
         print(f"Text channel with ID {TROUBLESHOOTING_CHANNEL_ID} was not found.")
 
 
+def is_staff_member(member_id: str) -> bool:
+    member = shared.guild.get_member(int(member_id))
+    if member is None:
+        return False
+
+    staff_roles = customer_support_roles + moderator_roles
+    return any(role in staff_roles for role in member.roles)
+
+
 async def create_ticket(reason: str, *, message: Message, author: Member):
     # Make sure we are accepting tickets
     if not is_accepting_tickets.get():
@@ -165,13 +177,24 @@ async def create_ticket(reason: str, *, message: Message, author: Member):
         )
     )
 
+    try:
+        assigned_staff_id = assignment_engine.assign(str(author.id), is_eligible=is_staff_member)
+    except StaleWriteError:
+        print(f"Could not assign the ticket for {author.id} because the assignments kept changing.")
+        assigned_staff_id = None
+    assigned_display = f"<@{assigned_staff_id}>" if assigned_staff_id else "Nobody available"
+
+    if assigned_staff_id:
+        await new_channel.send(f"<@{assigned_staff_id}> you have been assigned to this ticket.")
+
     if log_channel:
         await log_channel.send(
             embed=create_embed(
                 "Ticket Opened",
                 f"Channel: {new_channel.mention}\n"
                 f"Author: {author_name}\n"
-                f"Reason: {reason}"
+                f"Reason: {reason}\n"
+                f"Assigned to: {assigned_display}"
             )
         )
 
@@ -200,11 +223,31 @@ async def close_ticket(reason=None, *, message: Message):
 
     ticket_author_id = int(message.channel.name)
     key = f"ticket_{ticket_author_id}"
+
+    try:
+        assignment_engine.release(str(ticket_author_id))
+    except StaleWriteError:
+        print(f"Could not release the assignment for ticket {ticket_author_id} because the assignments kept changing.")
+
     if key in root:
         ticket_data = root[key]
+        close_time = datetime.datetime.now()
+        closed_by_display = f"{message.author.mention} ({message.author.name}#{message.author.discriminator})"
+
+        # Claimed before the first await so a second close in the same channel finds no ticket data and
+        # the ticket is only recorded once
+        del root[key]
+        history.append({
+            "author_id": ticket_data["author_id"],
+            "author_name": ticket_data["author_name"],
+            "reason": ticket_data["reason"],
+            "open_time": ticket_data["open_time"],
+            "close_time": math.floor(close_time.timestamp()),
+            "closed_by": closed_by_display,
+            "close_message": reason
+        })
 
         open_dt = datetime.datetime.fromtimestamp(ticket_data["open_time"])
-        close_time = datetime.datetime.now()
 
         diff = close_time - open_dt
 
@@ -218,8 +261,6 @@ async def close_ticket(reason=None, *, message: Message):
                             f"{minutes} minute(s) " \
                             f"{seconds} second(s)"
 
-        closed_by_display = f"{message.author.mention} ({message.author.name}#{message.author.discriminator})"
-
         ticket_info_embed = create_embed(
                 "Ticket Closed",
                 f"Author: {ticket_data['author_name']}\n"
@@ -247,20 +288,23 @@ async def close_ticket(reason=None, *, message: Message):
                 # The user probably has DMs turned off.
                 pass
 
-        del root[key]
-
         await message.channel.delete(reason=f"Closed by: {message.author}. Reason: {reason}")
     else:
         print("Could  not find ticket data when closing it. Deleting channel without.")
 
-        await message.channel.delete(reason=f"Closed by: {message.author}. Reason: {reason}")
+        try:
+            await message.channel.delete(reason=f"Closed by: {message.author}. Reason: {reason}")
+        except discord.errors.NotFound:
+            # Another close in this channel already deleted it.
+            pass
 
 
 async def set_accepting_tickets(str_value: str, *, message: Message):
-    if str_value == "true":
-        is_accepting_tickets.set(True)
-    else:
-        is_accepting_tickets.set(False)
+    try:
+        is_accepting_tickets.set(str_value == "true")
+    except StaleWriteError:
+        await message.channel.send(embed=STALE_WRITE_EMBED)
+        return
 
     await message.channel.send(
         embed=COMMAND_SUCCESS_EMBED
@@ -274,3 +318,27 @@ async def get_accepting_tickets(*, message: Message):
             "Yes" if is_accepting_tickets.get() else "No"
         )
     )
+
+
+async def set_available(str_value: str, *, message: Message):
+    try:
+        assignment_engine.set_available(str(message.author.id), str_value == "true")
+    except StaleWriteError:
+        await message.channel.send(embed=STALE_WRITE_EMBED)
+        return
+
+    await message.channel.send(
+        embed=COMMAND_SUCCESS_EMBED
+    )
+
+
+async def get_available(*, message: Message):
+    await message.channel.send(
+        embed=create_embed(
+            "Result",
+            "You are currently {}available for new tickets and have {} assigned ticket(s) open.".format(
+                "" if assignment_engine.is_available(str(message.author.id)) else "not ",
+                assignment_engine.counts.get(str(message.author.id), 0)
+            )
+        )
+    )
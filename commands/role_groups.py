@@ -8,4 +8,7 @@ SUPPORT = []
 
 ALL_STAFF = ADMIN + SUPPORT + MODERATORS
 
+# Staff that get access to tickets and can be assigned to them
+TICKET_STAFF = SUPPORT + MODERATORS
+
 EVERYONE = [0]
@@ -0,0 +1,131 @@
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+from .util import CommandEntry
+
+MAX_TOKEN_LENGTH = 32  # Longer tokens are never command keywords, so we don't bother looking them up
+
+
+def _max_distance(token: str) -> int:
+    # Short keywords are too close to each other to allow two edits
+    return 1 if len(token) <= 4 else 2
+
+
+def _deletes(word: str, distance: int) -> Set[str]:
+    results = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+def _edit_distance(a: str, b: str) -> int:
+    """
+    Optimal string alignment distance, so a swapped pair of letters counts as one edit.
+    """
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        previous_previous, previous = previous, current
+    return previous[len(b)]
+
+
+class _Node(object):
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.commands: List[CommandEntry] = []
+        self.deletes: Dict[str, Set[str]] = {}
+
+    def subtree_commands(self) -> List[CommandEntry]:
+        result = list(self.commands)
+        for child in self.children.values():
+            result += child.subtree_commands()
+        return result
+
+    def build_deletes(self):
+        for keyword in self.children:
+            for deleted in _deletes(keyword, _max_distance(keyword)):
+                self.deletes.setdefault(deleted, set()).add(keyword)
+        for child in self.children.values():
+            child.build_deletes()
+
+    def closest_child(self, token: str) -> Optional[str]:
+        candidates = set()
+        for deleted in _deletes(token, _max_distance(token)):
+            candidates |= self.deletes.get(deleted, set())
+
+        best: Optional[Tuple[int, str]] = None
+        for candidate in candidates:
+            distance = _edit_distance(token, candidate)
+            if distance <= max(_max_distance(token), _max_distance(candidate)) and (best is None or distance < best[0]):
+                best = (distance, candidate)
+
+        return best[1] if best else None
+
+
+class SuggestionIndex(object):
+    def __init__(self, commands: List[CommandEntry]):
+        """
+        Index over the keywords of prefixed commands, used to answer messages that start with the prefix but don't
+        match any command. Commands are stored in a trie keyed by the literal words at the start of their syntax,
+        and every trie node keeps a deletion index over its children so typos can be corrected without comparing
+        against every keyword.
+        :param commands: The commands to index.
+        """
+        self.root = _Node()
+
+        for command in commands:
+            if not command.require_prefix:
+                continue
+
+            node = self.root
+            for keyword in self.keywords(command):
+                node = node.children.setdefault(keyword, _Node())
+            node.commands.append(command)
+
+        self.root.build_deletes()
+
+    @staticmethod
+    def keywords(command: CommandEntry) -> List[str]:
+        keywords = []
+        for token in command.command_help_syntax.split():
+            if not re.fullmatch(r"\w+", token):
+                break
+            keywords.append(token.lower())
+        return keywords
+
+    def lookup(self, content: str) -> Tuple[List[CommandEntry], bool]:
+        """
+        Finds the commands a prefixed message was probably meant for.
+        :param content: The message content without the prefix.
+        :return: The matching commands, and whether any keyword had to be corrected.
+        """
+        node = self.root
+        corrected = False
+
+        for token in content.lower().split():
+            if not node.children or len(token) > MAX_TOKEN_LENGTH:
+                break
+
+            if token in node.children:
+                node = node.children[token]
+                continue
+
+            closest = node.closest_child(token)
+            if closest is None:
+                break
+
+            corrected = True
+            node = node.children[closest]
+
+        if node is self.root:
+            return [], False
+
+        return node.subtree_commands(), corrected
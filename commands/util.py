@@ -1,5 +1,6 @@
+import asyncio
 import re
-from typing import Callable, List, Tuple, Optional
+from typing import Callable, List, Optional
 
 import discord
 from discord import Message, Member
@@ -8,27 +9,23 @@ import settings
 import shared
 
 
-def create_embed(title: str, description: str, color=settings.embed_color.get()):
+def create_embed(title: str, description: str, color: Optional[int] = None):
     return discord.Embed(
         title=title,
         description=description,
-        color=color
+        color=settings.embed_color.get() if color is None else color
     )
 
 
-def create_error_embed(message: str, title: str = "Could Not Complete", color=settings.error_color.get()):
+def create_error_embed(message: str, title: str = "Could Not Complete", color: Optional[int] = None):
     return discord.Embed(
         title=title,
         description=message,
-        color=color
+        color=settings.error_color.get() if color is None else color
     )
 
 
-NOT_ALLOWED_EMBED = create_embed(
-    "Not Allowed",
-    "You are not allowed to use that command!",
-    color=settings.error_color.get()
-)
+NOT_ALLOWED_EMBED = create_error_embed("You are not allowed to use that command!", title="Not Allowed")
 
 COMMAND_SUCCESS_EMBED = create_embed(
     "Success",
@@ -37,6 +34,43 @@ COMMAND_SUCCESS_EMBED = create_embed(
 
 MEMBER_NOT_FOUND_EMBED = create_error_embed("That member could not be found.")
 
+STALE_WRITE_EMBED = create_error_embed("That setting was just changed by someone else. Please try again.")
+
+TIMED_OUT_EMBED = create_error_embed("The bot was too busy to start that command in time. Please try again later.")
+
+CANCELLED_EMBED = create_error_embed("The command stopped responding and was cancelled. Please check whether it "
+                                     "completed before trying again.")
+
+STILL_RUNNING_EMBED = create_embed(
+    "Still Working",
+    "That command is taking longer than usual. It will keep running and reply when it is done."
+)
+
+# The embeds above are shared, so they are recolored in place when the colors change
+_EMBEDS = [COMMAND_SUCCESS_EMBED, STILL_RUNNING_EMBED]
+_ERROR_EMBEDS = [NOT_ALLOWED_EMBED, MEMBER_NOT_FOUND_EMBED, STALE_WRITE_EMBED, TIMED_OUT_EMBED, CANCELLED_EMBED]
+
+
+def _on_embed_color_changed(value):
+    for embed in _EMBEDS:
+        embed.colour = value
+
+
+def _on_error_color_changed(value):
+    for embed in _ERROR_EMBEDS:
+        embed.colour = value
+
+
+settings.embed_color.subscribe(_on_embed_color_changed)
+settings.error_color.subscribe(_on_error_color_changed)
+
+DEFAULT_SHED_MESSAGE = "The bot is too busy to handle that command right now. Please try again in a moment."
+DEFAULT_COMMAND_TIMEOUT = 60  # Seconds before the user is told a command is slow, or it is dropped if still queued
+DEFAULT_HARD_TIMEOUT = 300  # Seconds before a started handler is cancelled as hung
+MAX_IN_FLIGHT_HANDLERS = 50  # Handlers running or queued across all commands
+
+_in_flight_handlers = 0
+
 
 def check_roles(member: Member, allowed_roles: List[int]) -> bool:
     if 0 in allowed_roles:
@@ -66,9 +100,13 @@ class CommandEntry(object):
     handler: Callable
     require_prefix: bool
     role_groups: List[int]
-    help_triggers: Tuple[str]
     command_help_syntax: str
     command_help_text: str
+    max_concurrency: Optional[int]
+    max_queue: int
+    timeout: Optional[float]
+    hard_timeout: Optional[float]
+    shed_message: str
 
     def __init__(self,
                  pattern: str,
@@ -76,18 +114,27 @@ class CommandEntry(object):
                  *,
                  role_groups: List[int],
                  require_prefix=True,
-                 help_triggers: Tuple[str] = (),
                  command_help_syntax: str,
-                 command_help_text: str):
+                 command_help_text: str,
+                 max_concurrency: Optional[int] = None,
+                 max_queue: int = 0,
+                 timeout: Optional[float] = DEFAULT_COMMAND_TIMEOUT,
+                 hard_timeout: Optional[float] = DEFAULT_HARD_TIMEOUT,
+                 shed_message: str = DEFAULT_SHED_MESSAGE):
         """
         An entry for a chat command.
         :param pattern: Regex pattern to match. Matching groups are passed to handler as args.
         :param handler: Callable handler.
         :param role_groups: Role groups that can use this command.
         :param require_prefix: Whether the command requires the use of the globally defined prefix.
-        :param help_triggers: If the command is not matched, then these keywords or phrases will trigger the
-        command syntax help message.
         :param command_help_syntax: A user-friendly string that should show the command's proper syntax.
+        :param max_concurrency: How many handlers for this command may run at once. None for no per-command limit.
+        :param max_queue: How many handlers may wait for a free slot before new ones are rejected.
+        :param timeout: Seconds before the user is told the command is slow. A handler still waiting for a slot by
+        then is dropped, one that has started keeps running since it may be halfway through its writes, but stops
+        counting against MAX_IN_FLIGHT_HANDLERS.
+        :param hard_timeout: Seconds after which a started handler is treated as hung and cancelled.
+        :param shed_message: Sent to the user when the command is rejected because of load.
         """
 
         # This is so we can use (@mention) in our patterns and it will still match
@@ -95,56 +142,104 @@ class CommandEntry(object):
         self.handler = handler
         self.require_prefix = require_prefix
         self.role_groups = role_groups
-        self.help_triggers = help_triggers
         self.command_help_syntax = command_help_syntax
         self.command_help_text = command_help_text
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.hard_timeout = hard_timeout
+        self.shed_message = shed_message
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pending = 0  # Handlers running or waiting for a slot
+
+    def is_overloaded(self) -> bool:
+        if _in_flight_handlers >= MAX_IN_FLIGHT_HANDLERS:
+            return True
+        return self.max_concurrency is not None and self._pending >= self.max_concurrency + self.max_queue
 
-    async def handle_message(self, message: Message):
-        allowed = check_roles(message.author, self.role_groups)
+    async def _acquire_and_run(self, groups: List[str], message: Message, started: asyncio.Event):
+        if self._semaphore is None:
+            started.set()
+            await self.handler(*groups, message=message)
+            return
+
+        async with self._semaphore:
+            started.set()
+            await self.handler(*groups, message=message)
 
+    def _finished(self, task: asyncio.Task):
+        self._pending -= 1
+
+    async def run_handler(self, groups: List[str], message: Message):
+        global _in_flight_handlers
+
+        if self.is_overloaded():
+            await message.channel.send(embed=create_error_embed(self.shed_message, title="Too Busy"))
+            return
+
+        if self.max_concurrency is not None and self._semaphore is None:
+            # Created lazily so it belongs to the running event loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        # Counted before the first await so handlers started in the same loop iteration see each other.
+        # The per-command count is released when the handler finishes, the global one once we stop waiting on it.
+        _in_flight_handlers += 1
+        self._pending += 1
+        started = asyncio.Event()
+        task = asyncio.ensure_future(self._acquire_and_run(groups, message, started))
+        task.add_done_callback(self._finished)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(task), self.timeout)
+            return
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            _in_flight_handlers -= 1
+
+        if not started.is_set():
+            # Still queued, so nothing has happened yet and it is safe to drop
+            task.cancel()
+            await message.channel.send(embed=TIMED_OUT_EMBED)
+            return
+
+        await message.channel.send(embed=STILL_RUNNING_EMBED)
+
+        remaining = None if self.hard_timeout is None else max(self.hard_timeout - self.timeout, 0)
+        try:
+            await asyncio.wait_for(task, remaining)
+        except asyncio.TimeoutError:
+            print(f"Cancelled a hung handler for {self.command_help_syntax} after {self.hard_timeout} seconds.")
+            await message.channel.send(embed=CANCELLED_EMBED)
+
+    def get_help_line(self) -> str:
+        command_syntax = (settings.prefix.get() + self.command_help_syntax
+                          if self.require_prefix else
+                          self.command_help_syntax)
+        return f"**`{command_syntax}`** - {self.command_help_text}"
+
+    async def handle_message(self, message: Message) -> bool:
+        """
+        Runs the handler if the message matches this command.
+        :return: Whether the message matched.
+        """
         full_pattern = re.escape(settings.prefix.get()) + self.pattern if self.require_prefix else self.pattern
         match = re.fullmatch(full_pattern, message.content)
 
-        if match:
-            if not allowed:
-                await message.channel.send(
-                    embed=NOT_ALLOWED_EMBED
-                )
-                return
+        if not match:
+            return False
+
+        if not check_roles(message.author, self.role_groups):
+            await message.channel.send(
+                embed=NOT_ALLOWED_EMBED
+            )
+            return True
 
-            groups = [group for group in match.groups() if group is not None]
+        groups = [group for group in match.groups() if group is not None]
 
-            await self.handler(*groups, message=message)
-        elif self.help_triggers:
-            # Check if we are just missing args, and if so notify the user.
-            matches_trigger = False
-            for trigger in self.help_triggers:
-                modified_trigger = trigger + r"\b"
-                exp = (
-                    re.escape(settings.prefix.get()) + modified_trigger
-                    if self.require_prefix else
-                    modified_trigger
-                )
-                if re.match(exp, message.content):
-                    matches_trigger = True
-                    break
-
-            if matches_trigger:
-                if allowed:
-                    command_syntax = (settings.prefix.get() + self.command_help_syntax
-                                      if self.require_prefix else
-                                      self.command_help_syntax)
-                    await message.channel.send(
-                        embed=create_embed(
-                            "Command Help",
-                            f"**`{command_syntax}`** - {self.command_help_text}"
-                        )
-                    )
-                else:
-                    await message.channel.send(
-                        embed=NOT_ALLOWED_EMBED
-                    )
-                    return
+        await self.run_handler(groups, message)
+        return True
 
 
 def create_help_embed(commands: List[CommandEntry]):
@@ -174,11 +269,7 @@ def create_help_embed(commands: List[CommandEntry]):
 
     for role_group_set in role_sets:
         commands_text = "\n".join([
-            "**`" + (
-                settings.prefix.get() + command.command_help_syntax
-                if command.require_prefix else
-                command.command_help_syntax
-            ) + f"`** - {command.command_help_text}"
+            command.get_help_line()
             for command in commands_by_roles[role_group_set]
         ])
 
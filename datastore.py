@@ -1,30 +1,258 @@
+import asyncio
+import dbm
 import json
 import shelve
-from typing import Any
+import traceback
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import os
 
+from failover import lease, lock_file
+
 curdir = os.path.dirname(__file__)
-_real_shelve = shelve.open(os.path.join(curdir, 'data'))
+DATA_PATH = os.path.join(curdir, 'data')
+JOURNAL_PATH = os.path.join(curdir, 'data.journal')
+WATCH_INTERVAL = 1  # Seconds between checks for changes made by other processes
+JOURNAL_COMPACT_SIZE = 1024 * 1024  # Bytes of journal the leader keeps before starting a new one
+
+# Every write is appended to the journal, and the process that owns the shelve folds the journal into it.
+# Standbys only read until they are promoted to leader, and the editor below only appends to the journal.
+read_only = lease.is_standby()
+journal_only = __name__ == "__main__"
+_real_shelve = None if read_only or journal_only else shelve.open(DATA_PATH)
+
+_reload_callbacks: List[Callable[[], None]] = []
+
+
+class StaleWriteError(Exception):
+    pass
+
+
+def _read_snapshot() -> Tuple[dict, Dict[str, int], int, int]:
+    """
+    :return: The stored values, their versions, the journal generation they belong to and how much of that journal
+    they include.
+    """
+    if _real_shelve is not None:
+        shelf = _real_shelve
+    else:
+        flag = 'r'
+        if dbm.whichdb(DATA_PATH) == 'dbm.gnu':
+            # Don't take gdbm's lock, the leader is holding it
+            flag += 'u'
+        try:
+            shelf = shelve.open(DATA_PATH, flag)
+        except dbm.error:
+            return {}, {}, 0, 0
+
+    try:
+        value = json.loads(shelf["root"]) if "root" in shelf else {}
+        versions = json.loads(shelf["versions"]) if "versions" in shelf else {}
+        generation = shelf.get("journal_generation", 0)
+        offset = shelf.get("journal_offset", 0)
+        return value, versions, generation, offset
+    finally:
+        if shelf is not _real_shelve:
+            shelf.close()
+
+
+@contextmanager
+def _locked_journal(exclusive: bool):
+    with open(JOURNAL_PATH, "a+b") as f:
+        lock_file(f, exclusive)
+        yield f
+
+
+def _journal_header(generation: int) -> bytes:
+    return json.dumps({"generation": generation}).encode("utf-8") + b"\n"
+
+
+def _read_generation(f) -> Optional[int]:
+    """
+    :return: The generation in the journal's header line, or None if the journal is empty.
+    """
+    f.seek(0)
+    try:
+        return json.loads(f.readline())["generation"]
+    except (ValueError, KeyError, TypeError):
+        return None
 
 
 class Root(object):
+    value: dict
+    versions: Dict[str, int]
+    generation: int
+    offset: int
+
     def __init__(self):
-        try:
-            self.value = json.loads(_real_shelve["root"])
-        except KeyError:
-            self.value = {}
+        self._subscribers: Dict[str, List[Callable[[Any], None]]] = {}
+        self.value, self.versions, self.generation, self.offset = _read_snapshot()
+
+        if _real_shelve is None:
+            self.catch_up()
+            return
+
+        with _locked_journal(exclusive=True) as f:
+            if _read_generation(f) == self.generation:
+                self._apply_new_entries(f)
+            elif os.fstat(f.fileno()).st_size:
+                print("Ignoring a datastore journal that doesn't belong to the snapshot.")
+            self._compact(f)
+
+    def subscribe(self, key: str, callback: Callable[[Any], None]):
+        """
+        Registers a callback that is called with the new value (None if deleted) whenever the key changes,
+        including changes made by other processes.
+        """
+        self._subscribers.setdefault(key, []).append(callback)
+
+    def _compact(self, f):
+        """
+        Starts a new journal generation once everything in the current one is in the snapshot.
+        Must be called with the journal locked exclusively.
+        """
+        header = _journal_header(self.generation + 1)
+
+        # The snapshot is written first so a crash in between leaves a journal that is simply ignored
+        self.generation += 1
+        self.offset = len(header)
+        self.update_shelve()
+
+        f.truncate(0)
+        f.write(header)
+        f.flush()
+        os.fsync(f.fileno())
+
+    def _apply_new_entries(self, f):
+        generation = _read_generation(f)
+        size = os.fstat(f.fileno()).st_size
+
+        if generation is None:
+            # Nobody has written to this journal yet
+            return
+
+        if generation != self.generation:
+            # The leader started a new journal, our snapshot tells us where to pick it up
+            self.value, self.versions, self.generation, self.offset = _read_snapshot()
+            for key, callbacks in self._subscribers.items():
+                for callback in callbacks:
+                    callback(self.value.get(key))
+
+            if generation != self.generation:
+                # The journal doesn't belong to the snapshot (the leader crashed while compacting), the snapshot
+                # already has everything in it
+                self.generation = generation
+                self.offset = size
+                return
+
+        if self.offset == 0:
+            # Start right after the header
+            f.seek(0)
+            f.readline()
+            self.offset = f.tell()
+
+        f.seek(self.offset)
+        data = f.read()
+        # Only apply complete lines, a writer may still be appending
+        end = data.rfind(b"\n") + 1
+
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+                key = entry["key"]
+                version = entry["version"]
+            except (ValueError, KeyError, TypeError):
+                print("Skipping an invalid line in the datastore journal.")
+                continue
+
+            if entry.get("deleted"):
+                self.value.pop(key, None)
+            else:
+                self.value[key] = entry.get("value")
+            self.versions[key] = version
+
+            for callback in self._subscribers.get(key, []):
+                callback(self.value.get(key))
+
+        self.offset += end
+
+    def catch_up(self):
+        """
+        Applies changes made by other processes since the last call.
+        """
+        with _locked_journal(exclusive=False) as f:
+            self._apply_new_entries(f)
+
+    def _write(self, key: str, entry: Dict[str, Any], base_version: Optional[int]):
+        if read_only:
+            raise RuntimeError("The datastore is read-only while this process is a standby.")
+
+        with _locked_journal(exclusive=True) as f:
+            if not lease.holds_lease():
+                # Checked under the journal lock so a paused old leader can't write after a standby took over
+                raise RuntimeError("This process no longer holds the leader lease.")
+
+            self._apply_new_entries(f)
+
+            current_version = self.versions.get(key, 0)
+            if base_version is not None and base_version != current_version:
+                raise StaleWriteError(
+                    f"{key} was changed by another process (version {current_version}, expected {base_version})."
+                )
+
+            entry["key"] = key
+            entry["version"] = current_version + 1
+            line = json.dumps(entry).encode("utf-8") + b"\n"
+
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                line = _journal_header(self.generation) + line
+                self.offset = 0
+            else:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    # A writer died in the middle of a line, end it so it is skipped instead of corrupting ours
+                    line = b"\n" + line
+
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+            self._apply_new_entries(f)
+
+            if _real_shelve is not None:
+                if self.offset > JOURNAL_COMPACT_SIZE:
+                    self._compact(f)
+                else:
+                    self.update_shelve()
+
+    def set(self, key, value, base_version: Optional[int] = None):
+        """
+        Sets a key.
+        :param base_version: If given, the write is rejected with StaleWriteError unless the key is still at
+        this version.
+        """
+        self._write(key, {"value": value}, base_version)
+
+    def delete(self, key, base_version: Optional[int] = None):
+        self._write(key, {"deleted": True}, base_version)
 
     def update_shelve(self):
+        if read_only:
+            raise RuntimeError("The datastore is read-only while this process is a standby.")
         _real_shelve["root"] = json.dumps(self.value)
+        _real_shelve["versions"] = json.dumps(self.versions)
+        _real_shelve["journal_generation"] = self.generation
+        _real_shelve["journal_offset"] = self.offset
         _real_shelve.sync()
 
     def __setitem__(self, key, value):
-        self.value[key] = value
-        self.update_shelve()
+        self.set(key, value)
 
     def __delitem__(self, key):
-        del self.value[key]
-        self.update_shelve()
+        if key not in self.value:
+            raise KeyError(key)
+        self.delete(key)
 
     def __getitem__(self, item):
         return self.value[item]
@@ -42,19 +270,83 @@ _shelve = root
 
 def safe_get(k, d):
     if k not in root:
-        root[k] = d
+        if not read_only:
+            root[k] = d
         return d
     else:
         return root[k]
 
 
+def on_reload(callback: Callable[[], None]):
+    """
+    Registers a callback that is called after this process is promoted to leader.
+    """
+    _reload_callbacks.append(callback)
+
+
+def promote():
+    """
+    Reopens the datastore for writing and applies anything the previous leader wrote that we haven't seen yet.
+    """
+    global read_only, _real_shelve
+
+    shelf = shelve.open(DATA_PATH)
+    _real_shelve = shelf
+    read_only = False
+    try:
+        root.catch_up()
+        root.update_shelve()
+    except Exception:
+        # Stay a read-only standby so the takeover can be retried
+        read_only = True
+        _real_shelve = None
+        shelf.close()
+        raise
+
+    for callback in _reload_callbacks:
+        callback()
+
+
+async def watch():
+    """
+    Applies changes made by other processes, such as the editor below, as they are written to the journal.
+    """
+    while True:
+        await asyncio.sleep(WATCH_INTERVAL)
+        try:
+            root.catch_up()
+        except Exception:
+            # Keep the change feed running, the next check will try again
+            traceback.print_exc()
+
+
 class Property(object):
     key: str
+    default: Any
+    version: int
     _value: Any
 
     def __init__(self, key: str, default: Any):
         self.key = key
+        self.default = default
         self._value = safe_get(key, default)
+        self.version = root.versions.get(key, 0)
+        self._subscribers: List[Callable[[Any], None]] = []
+        root.subscribe(key, self._on_change)
+
+    def _on_change(self, value: Any):
+        self._value = value if self.key in root else self.default
+        self.version = root.versions.get(self.key, 0)
+
+        for callback in self._subscribers:
+            callback(self._value)
+
+    def subscribe(self, callback: Callable[[Any], None]):
+        """
+        Registers a callback that is called with the new value whenever the property changes,
+        including changes made by other processes.
+        """
+        self._subscribers.append(callback)
 
     def __str__(self):
         return str(self._value)
@@ -63,8 +355,10 @@ class Property(object):
         return str(self._value)
 
     def set(self, value: Any):
-        self._value = value
-        root[self.key] = self._value
+        """
+        :raises StaleWriteError: If another process changed the property since we last saw it.
+        """
+        root.set(self.key, value, base_version=self.version)
 
     def get(self):
         return self._value
@@ -87,6 +381,7 @@ if __name__ == "__main__":
 
             for key, value in decoded.items():
                 root[key] = value
+                print(f"{key} is now at version {root.versions[key]}.")
 
         except json.decoder.JSONDecodeError:
             print("Invalid JSON.")
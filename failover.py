@@ -0,0 +1,200 @@
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, where the bot runs without a standby
+    fcntl = None
+
+curdir = os.path.dirname(__file__)
+LEASE_PATH = os.path.join(curdir, 'leader.lock')
+LEASE_DURATION = 10  # Seconds a lease stays valid without a heartbeat
+HEARTBEAT_INTERVAL = 2  # Seconds between heartbeats (and between takeover attempts for standbys)
+STARTUP_GRACE = 120  # Seconds we keep the lease before the event loop has started ticking
+
+
+def lock_file(f, exclusive: bool = True):
+    """
+    Locks an open file until it is closed. Does nothing where file locking isn't available.
+    """
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+
+class Lease(object):
+    path: str
+    duration: float
+    heartbeat_interval: float
+    owner: str
+    enabled: bool
+    is_leader: bool
+
+    def __init__(self, path: str, duration: float = LEASE_DURATION, heartbeat_interval: float = HEARTBEAT_INTERVAL):
+        """
+        A leader lease stored in a local lock file. The leader renews the lease with heartbeats and standbys take it
+        over once it expires.
+        :param path: Path of the lock file.
+        :param duration: Seconds the lease stays valid after a heartbeat.
+        :param heartbeat_interval: Seconds between heartbeats.
+        """
+        self.path = path
+        self.duration = duration
+        self.heartbeat_interval = heartbeat_interval
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex}"
+        self.enabled = False
+        self.is_leader = False
+        self._started_at = time.monotonic()
+        self._last_tick: Optional[float] = None
+
+    def _read(self) -> Dict[str, Any]:
+        with open(self.path, "a+") as f:
+            lock_file(f)
+            f.seek(0)
+            try:
+                return json.loads(f.read() or "{}")
+            except ValueError:
+                return {}
+
+    def holds_lease(self) -> bool:
+        """
+        Checks the lock file to see whether we still hold an unexpired lease. Always true when the lease is disabled.
+        """
+        if not self.enabled:
+            return True
+
+        current = self._read()
+        return current.get("owner") == self.owner and current.get("expires_at", 0) > time.time()
+
+    def _loop_alive(self) -> bool:
+        if self._last_tick is None:
+            return time.monotonic() - self._started_at < STARTUP_GRACE
+        # Stop renewing early enough that the lease runs out while the loop is stuck
+        return time.monotonic() - self._last_tick < self.duration - self.heartbeat_interval
+
+    def _update(self, acquire: bool, release: bool = False) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Atomically renews, acquires or releases the lease.
+        :return: Whether we hold the lease afterwards, and the lease as it was before the update.
+        """
+        with open(self.path, "a+") as f:
+            lock_file(f)
+
+            f.seek(0)
+            try:
+                current = json.loads(f.read() or "{}")
+            except ValueError:
+                current = {}
+
+            now = time.time()
+            held_by_us = current.get("owner") == self.owner
+            expired = current.get("expires_at", 0) <= now
+
+            if not (held_by_us or (acquire and expired)):
+                return False, current
+
+            f.seek(0)
+            f.truncate()
+            json.dump({
+                "owner": self.owner,
+                "pid": os.getpid(),
+                "heartbeat": now,
+                "expires_at": now if release else now + self.duration
+            }, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+            return not release, current
+
+    def start(self):
+        """
+        Enables the lease and tries to become the leader. Processes that don't get the lease start as a standby.
+        """
+        if fcntl is None:
+            print("File locking is not available on this platform, starting as leader without a standby lease.")
+            self.is_leader = True
+            return
+
+        self.enabled = True
+        self._started_at = time.monotonic()
+        self.is_leader, _ = self._update(acquire=True)
+        atexit.register(self.release)
+
+        # Heartbeats run on their own thread so slow startup work (loading the history, logging in, chunking the
+        # guild) can't let the lease expire before the event loop is up. Once maintain() runs, they are only sent
+        # while it keeps ticking.
+        threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True).start()
+
+        print(f"Starting as {'leader' if self.is_leader else 'standby'}.")
+
+    def is_standby(self) -> bool:
+        return self.enabled and not self.is_leader
+
+    def release(self):
+        if self.is_leader:
+            # Stop the heartbeat thread from renewing before we give the lease up
+            self.is_leader = False
+            self._update(acquire=False, release=True)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+
+            if not self.is_leader:
+                continue
+
+            if not self._loop_alive():
+                # The event loop is stuck, so let the lease expire and a standby take over
+                continue
+
+            renewed, _ = self._update(acquire=False)
+            if not renewed:
+                # Another process took over while we were stalled, so stop before we write anything.
+                print("Lost the leader lease, exiting.")
+                os._exit(1)
+
+    async def maintain(self, on_promote: Callable[[], None]):
+        """
+        Tells the heartbeat thread that the event loop is alive and, while we are a standby, takes over the lease once
+        it expires.
+        :param on_promote: Called after we take the lease and before we act as leader. If it raises, the lease is
+        released and the takeover is retried.
+        """
+        while True:
+            self._last_tick = time.monotonic()
+            await asyncio.sleep(self.heartbeat_interval)
+
+            if self.is_leader or not self.enabled:
+                continue
+
+            acquired, previous = self._update(acquire=True)
+            if not acquired:
+                continue
+
+            takeover_time = time.time()
+            try:
+                on_promote()
+            except Exception:
+                # Don't act as leader with a half promoted datastore, let the lease go and try again later
+                traceback.print_exc()
+                print("Could not take over as leader, releasing the lease.")
+                self._update(acquire=False, release=True)
+                continue
+
+            self.is_leader = True
+
+            since_heartbeat = takeover_time - previous.get("heartbeat", takeover_time)
+            print(
+                f"Took over as leader {since_heartbeat:.2f}s after the previous leader's last heartbeat "
+                f"and was ready {time.time() - takeover_time:.2f}s later."
+            )
+
+
+lease = Lease(LEASE_PATH)
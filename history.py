@@ -0,0 +1,215 @@
+import asyncio
+import bisect
+import json
+import os
+import re
+from typing import Any, Dict, List, Tuple
+
+from datastore import WATCH_INTERVAL, on_reload
+
+curdir = os.path.dirname(__file__)
+HISTORY_PATH = os.path.join(curdir, 'ticket_history.jsonl')
+
+_token_pattern = re.compile(r"\w{2,}")
+
+
+def tokenize(text: str) -> List[str]:
+    if not text:
+        return []
+    return list(dict.fromkeys(token.lower() for token in _token_pattern.findall(text)))
+
+
+def _newest_first_page(ids: List[int], page: int, page_size: int) -> List[int]:
+    end = len(ids) - page * page_size
+    start = max(end - page_size, 0)
+    if end <= 0:
+        return []
+    return ids[start:end][::-1]
+
+
+class TicketHistory(object):
+    path: str
+    record_offsets: List[int]
+    by_author: Dict[str, List[int]]
+    by_token: Dict[str, List[int]]
+    by_close_time: List[Tuple[int, int]]
+
+    def __init__(self, path: str = HISTORY_PATH):
+        """
+        Append-only store of closed tickets. Records are kept in a JSON lines file and indexed in memory by author,
+        close time and the tokens in the reason and close message. Only the byte offset of each record is kept in
+        memory, the records on a page are read from the file when they are requested.
+        :param path: Path of the history file.
+        """
+        self.path = path
+        self.offset = 0
+        self._file = None
+        self.record_offsets = []
+        self.by_author = {}
+        self.by_token = {}
+        self.by_close_time = []
+        self.catch_up()
+
+    def catch_up(self):
+        """
+        Indexes records appended to the history file since the last call. Standbys call this periodically so they
+        stay current without re-reading the whole file.
+        """
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == self.offset:
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+
+        # Only index complete lines, the leader may still be appending
+        end = data.rfind(b"\n") + 1
+        position = 0
+        while position < end:
+            line_end = data.index(b"\n", position) + 1
+            line = data[position:line_end]
+            line_offset = self.offset + position
+            position = line_end
+
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print("Skipping an invalid line in the ticket history.")
+                continue
+            self._index(record, line_offset)
+
+        self.offset += end
+
+    def promote(self):
+        """
+        Picks up anything the previous leader appended and opens the history for appending.
+        """
+        self._open()
+
+    def _open(self):
+        if self._file is not None:
+            return
+
+        self.catch_up()
+        self._file = open(self.path, "ab")
+        if os.path.getsize(self.path) > self.offset:
+            # A previous leader died in the middle of a write, end that line so it is skipped
+            self._file.write(b"\n")
+
+    def _index(self, record: Dict[str, Any], offset: int) -> int:
+        record_id = len(self.record_offsets)
+        self.record_offsets.append(offset)
+
+        self.by_author.setdefault(record["author_id"], []).append(record_id)
+
+        for token in tokenize(record.get("reason")) + tokenize(record.get("close_message")):
+            postings = self.by_token.setdefault(token, [])
+            # A token can appear in both the reason and the close message
+            if not postings or postings[-1] != record_id:
+                postings.append(record_id)
+
+        bisect.insort(self.by_close_time, (record["close_time"], record_id))
+        return record_id
+
+    def _read(self, ids: List[int]) -> List[Dict[str, Any]]:
+        """
+        Reads records from the history file.
+        """
+        records = []
+        with open(self.path, "rb") as f:
+            for record_id in ids:
+                f.seek(self.record_offsets[record_id])
+                record = json.loads(f.readline())
+                record["id"] = record_id
+                records.append(record)
+        return records
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """
+        Appends a closed ticket to the history.
+        :return: The ID of the new record.
+        """
+        self._open()
+
+        record_id = self._index(record, self._file.tell())
+
+        self._file.write(json.dumps(record).encode("utf-8") + b"\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.offset = self._file.tell()
+
+        return record_id
+
+    def by_author_id(self, author_id: str, page: int = 0, page_size: int = 10) -> Tuple[int, List[Dict[str, Any]]]:
+        ids = self.by_author.get(str(author_id), [])
+        return len(ids), self._read(_newest_first_page(ids, page, page_size))
+
+    def search(self, text: str, page: int = 0, page_size: int = 10) -> Tuple[int, bool, List[Dict[str, Any]]]:
+        """
+        Finds tickets whose reason or close message contain every word in text, newest first. Only as much of the
+        postings as the requested page needs is scanned, so the total is estimated unless the scan reached the end.
+        :return: The total, whether the total is exact, and the tickets on the page.
+        """
+        tokens = tokenize(text)
+        if not tokens:
+            return 0, True, []
+
+        postings = sorted((self.by_token.get(token, []) for token in tokens), key=len)
+        smallest, others = postings[0], postings[1:]
+
+        if not others:
+            return len(smallest), True, self._read(_newest_first_page(smallest, page, page_size))
+
+        def contains(ids: List[int], record_id: int) -> bool:
+            i = bisect.bisect_left(ids, record_id)
+            return i < len(ids) and ids[i] == record_id
+
+        # One more than the page needs, so we know whether there is a next page
+        needed = (page + 1) * page_size + 1
+        matches = []
+        scanned = 0
+        for record_id in reversed(smallest):
+            scanned += 1
+            if all(contains(other, record_id) for other in others):
+                matches.append(record_id)
+                if len(matches) == needed:
+                    break
+
+        page_ids = matches[page * page_size:(page + 1) * page_size]
+        records = self._read(page_ids)
+
+        if scanned == len(smallest):
+            return len(matches), True, records
+
+        estimate = max(round(len(matches) / scanned * len(smallest)), len(matches))
+        return estimate, False, records
+
+    def by_date(self, start_time: int, end_time: int, page: int = 0,
+                page_size: int = 10) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Returns tickets closed in [start_time, end_time).
+        """
+        lo = bisect.bisect_left(self.by_close_time, (start_time, -1))
+        hi = max(bisect.bisect_left(self.by_close_time, (end_time, -1)), lo)
+
+        end = hi - page * page_size
+        start = max(end - page_size, lo)
+        if end <= lo:
+            return hi - lo, []
+
+        return hi - lo, self._read([record_id for _, record_id in reversed(self.by_close_time[start:end])])
+
+
+history = TicketHistory()
+on_reload(history.promote)
+
+
+async def watch():
+    """
+    Keeps the history current while another process is the leader.
+    """
+    while True:
+        await asyncio.sleep(WATCH_INTERVAL)
+        history.catch_up()
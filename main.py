@@ -1,6 +1,10 @@
 #!venv/bin/python
 import sys
 
+# The lease has to be settled before anything loads the datastore, since standbys open it read-only.
+from failover import lease
+lease.start()
+
 import discord
 from discord import Message
 
@@ -8,15 +12,22 @@ from commands.handlers.tickets import setup as setup_tickets_module
 from commands.handlers.buyers import setup as setup_buyers_module
 import settings
 import shared
+import datastore
+import history
 from client import client
 from commands import handle_message
 
 
 DISCORD_TOKEN = "Place your token here"
 
+watch_task = None
+history_watch_task = None
+
 
 @client.event
 async def on_ready():
+    global watch_task, history_watch_task
+
     print(f"{client.user.name} Ready")
     print("-" * 10)
 
@@ -32,12 +43,21 @@ async def on_ready():
     setup_tickets_module()
     setup_buyers_module()
 
+    if watch_task is None:
+        watch_task = client.loop.create_task(datastore.watch())
+    if history_watch_task is None:
+        history_watch_task = client.loop.create_task(history.watch())
+
     @client.event
     async def on_message(message: Message):
         if message.author == client.user:
             # Don't process our own messages
             return
 
+        if not lease.is_leader:
+            # Only the leader handles commands, standbys just stay warm
+            return
+
         if message.channel.type == discord.ChannelType.private:
             await message.channel.send("Sorry, I can't help you in a private chat.")
             return
@@ -53,4 +73,6 @@ async def on_ready():
         await handle_message(message)
 
 
+# Started before logging in so the lease heartbeats follow the event loop as soon as it runs
+client.loop.create_task(lease.maintain(on_promote=datastore.promote))
 client.run(DISCORD_TOKEN)
@@ -0,0 +1,110 @@
+import sys
+import threading
+from collections import Counter
+from types import CodeType
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_INTERVAL = 0.005  # Seconds between samples
+
+
+def _frame_name(code: CodeType) -> str:
+    module = code.co_filename.rsplit("/", 1)[-1].rsplit("\\", 1)[-1]
+    return f"{module}:{code.co_name}"
+
+
+class SamplingProfiler(object):
+    interval: float
+    handler_names: Dict[CodeType, str]
+    function_samples: Counter
+    handler_samples: Counter
+    stack_samples: Counter
+    total_samples: int
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        """
+        A sampling profiler that periodically captures the stack of the main thread (where the event loop runs).
+        Nothing is hooked into the interpreter, so there is no overhead while the profiler is not running.
+        :param interval: Seconds between samples.
+        """
+        self.interval = interval
+        self.handler_names = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._target_thread_id = threading.main_thread().ident
+        self.reset()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def reset(self):
+        self.function_samples = Counter()
+        self.handler_samples = Counter()
+        self.stack_samples = Counter()
+        self.total_samples = 0
+
+    def register_handlers(self, commands):
+        """
+        Registers command handlers so samples can be attributed to the command that was running.
+        :param commands: Iterable of CommandEntry.
+        """
+        for command in commands:
+            code = getattr(command.handler, "__code__", None)
+            if code is not None:
+                self.handler_names[code] = command.handler.__qualname__
+
+    def start(self):
+        if self.running:
+            raise RuntimeError("The profiler is already running.")
+
+        self.reset()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is not None:
+                self._sample(frame)
+
+    def _sample(self, frame):
+        stack: List[str] = []
+        handler = None
+        while frame is not None:
+            code = frame.f_code
+            stack.append(_frame_name(code))
+            if handler is None and code in self.handler_names:
+                handler = self.handler_names[code]
+            frame = frame.f_back
+
+        stack.reverse()
+
+        self.total_samples += 1
+        self.function_samples[stack[-1]] += 1
+        self.stack_samples[";".join(stack)] += 1
+        self.handler_samples[handler or "<idle/other>"] += 1
+
+    def top_functions(self, n: int) -> List[Tuple[str, int]]:
+        return self.function_samples.most_common(n)
+
+    def top_handlers(self, n: int) -> List[Tuple[str, int]]:
+        return self.handler_samples.most_common(n)
+
+    def collapsed_stacks(self) -> str:
+        """
+        Returns the samples in the collapsed stack format understood by flamegraph.pl and speedscope.
+        """
+        return "\n".join(f"{stack} {count}" for stack, count in self.stack_samples.most_common()) + "\n"
+
+
+profiler = SamplingProfiler()
+